@@ -1,105 +1,284 @@
 import boto3
-import json
+import io
+import itertools
 import logging
+import orjson
+import re
+import time
 import urllib.parse
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 
-s3 = boto3.client("s3")
-smr = boto3.client("sagemaker-runtime")
+MAX_WORKERS = 16  # concurrent invoke_endpoint calls
+
+# boto3 clients are thread-safe; size the pool so every worker gets a connection.
+# Clients live at module scope so warm invocations reuse them and their open connections.
+_cfg = Config(max_pool_connections=64, retries={"max_attempts": 5, "mode": "adaptive"}, tcp_keepalive=True)
+
+# enriched files above 8 MB are uploaded as parallel multipart parts, smaller ones in a single PUT
+_transfer_cfg = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=8, use_threads=True)
+
+s3 = boto3.client("s3", config=_cfg)
+smr = boto3.client("sagemaker-runtime", config=_cfg)
+sm = None  # SageMaker control-plane client, only batch mode needs it so it is created on first use
+
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
 SOURCE_BUCKET = "reddit-crawler-bucket"
 DEST_BUCKET = "x-enriched-bucket"
 ENDPOINT_NAME = "huggingface-pytorch-inference-2025-08-31-17-46-16-561"
 MAX_CHARS = 1024
+TEXT_KEYS = ("content", "text", "rawContent", "full_text")  # first non-empty one is scored
+BATCH_SIZE = 16  # tweets per invoke_endpoint call
+STREAM_THRESHOLD = 5 * 1024 * 1024  # files above this size are parsed incrementally
+
+# "realtime" scores the tweets inline on ENDPOINT_NAME.
+# "async" stages them under PENDING_PREFIX and queues them on ASYNC_ENDPOINT_NAME.
+# "batch" stages them under PENDING_PREFIX and starts a Batch Transform job on MODEL_NAME.
+# For "async" and "batch", merge_lambda writes the enriched file once the predictions land in S3.
+INFERENCE_MODE = "realtime"
+ASYNC_ENDPOINT_NAME = "huggingface-pytorch-inference-async"  # endpoint_name used by deploy_model.py
+MODEL_NAME = "huggingface-pytorch-inference-2025-08-31-17-46-16-561"
+TRANSFORM_INSTANCE_TYPE = "ml.m5.xlarge"
+STAGE_BUCKET = SOURCE_BUCKET
+PENDING_PREFIX = "pending"
+
+# the request body shape is fixed, only the encoded inputs change between calls
+_BODY_PREFIX = b'{"inputs":'
+_BODY_SUFFIX = b',"parameters":{"truncation":true}}'
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 def _pick_best_label(result_json):
-    if isinstance(result_json, list) and result_json:
-        first = result_json[0]
-        preds = first if isinstance(first, list) else result_json
-        preds = [p for p in preds if isinstance(p, dict) and "label" in p]
-        if preds:
-            best = max(preds, key=lambda x: x.get("score", 0.0))
-            return best.get("label", "unknown"), float(best.get("score", 0.0))
-    return "unknown", 0.0
+    if not isinstance(result_json, list) or not result_json:
+        return "unknown", 0.0
+
+    first = result_json[0]
+    preds = first if isinstance(first, list) else result_json
+    best = max(
+        (p for p in preds if isinstance(p, dict) and "label" in p),
+        key=lambda p: p.get("score", 0.0),
+        default=None
+    )
+    if best is None:
+        return "unknown", 0.0
+    return best["label"], float(best.get("score", 0.0))
+
+def _load_tweets(bucket, key):
+    """
+    Fetch and parse the tweet array of an S3 object.
+    Large files are parsed off the stream, so the raw bytes are not buffered alongside the parsed tweets.
+    """
+    obj_data = s3.get_object(Bucket=bucket, Key=key)
+    if obj_data["ContentLength"] > STREAM_THRESHOLD:
+        import ijson  # only needed for large files
+
+        # items(..., "item") silently yields nothing for a non-array document, so check the first event
+        events = ijson.parse(obj_data["Body"], use_float=True)
+        first = next(events, None)
+        if first is None or first[1] != "start_array":
+            raise ValueError(f"expected a JSON array of tweets in {key}")
+        return list(ijson.items(itertools.chain([first], events), "item"))
+
+    tweets = orjson.loads(obj_data["Body"].read())
+    if not isinstance(tweets, list):
+        raise ValueError(f"expected a JSON array of tweets in {key}")
+    return tweets
+
+def _classify_batch(texts, batch_tweets):
+    """
+    Run one batch of texts through the endpoint and write the labels onto the matching tweets.
+    """
+    try:
+        resp = smr.invoke_endpoint(
+            EndpointName=ENDPOINT_NAME,
+            ContentType="application/json",
+            Body=_BODY_PREFIX + orjson.dumps(texts) + _BODY_SUFFIX
+        )
+        results = orjson.loads(resp["Body"].read())
+        if not isinstance(results, list) or len(results) != len(texts):
+            raise ValueError(f"expected {len(texts)} predictions, got {results!r}")
+    except Exception as model_err:
+        logger.error("Failed to run SageMaker model on a batch of %d tweets: %s", len(texts), model_err)
+        return
+
+    for tw, result in zip(batch_tweets, results):
+        label, score = _pick_best_label(result if isinstance(result, list) else [result])
+        tw["sentiment"] = label
+        tw["sentiment_score"] = score
+
+def _stage_tweets(tweets, index, dest_key):
+    """
+    Park the tweets in S3 until merge_lambda joins the predictions back onto them.
+    `index` holds the position in `tweets` of each text sent to the model.
+    """
+    s3.put_object(
+        Bucket=STAGE_BUCKET,
+        Key=f"{PENDING_PREFIX}/tweets/{dest_key}",
+        Body=orjson.dumps({"index": index, "tweets": tweets}),
+        ContentType="application/json"
+    )
+
+def _submit_async(texts, dest_key):
+    """
+    Stage the model input in S3 and queue it on the async endpoint.
+    """
+    input_key = f"{PENDING_PREFIX}/input/{dest_key}"
+    s3.put_object(
+        Bucket=STAGE_BUCKET,
+        Key=input_key,
+        Body=_BODY_PREFIX + orjson.dumps(texts) + _BODY_SUFFIX,
+        ContentType="application/json"
+    )
+
+    resp = smr.invoke_endpoint_async(
+        EndpointName=ASYNC_ENDPOINT_NAME,
+        InputLocation=f"s3://{STAGE_BUCKET}/{input_key}",
+        ContentType="application/json"
+    )
+    logger.debug("Queued %d tweets for %s, output will be written to %s", len(texts), dest_key, resp["OutputLocation"])
+
+def _submit_transform(texts, dest_key):
+    """
+    Stage the model input as JSON Lines and start a Batch Transform job over it.
+    The job writes one prediction per line to batch-output/<name>.jsonl.out.
+    """
+    name = dest_key.rsplit(".", 1)[0]
+    input_key = f"{PENDING_PREFIX}/batch-input/{name}.jsonl"
+    s3.put_object(
+        Bucket=STAGE_BUCKET,
+        Key=input_key,
+        Body=b"\n".join(_BODY_PREFIX + orjson.dumps(text) + _BODY_SUFFIX for text in texts),
+        ContentType="application/jsonlines"
+    )
+
+    global sm
+    if sm is None:
+        sm = boto3.client("sagemaker", config=_cfg)
+
+    # job names allow [a-zA-Z0-9-] and at most 63 characters
+    job_name = f"{re.sub(r'[^a-zA-Z0-9-]', '-', name)[:48]}-{int(time.time())}"
+    sm.create_transform_job(
+        TransformJobName=job_name,
+        ModelName=MODEL_NAME,
+        BatchStrategy="SingleRecord",
+        MaxConcurrentTransforms=4,
+        MaxPayloadInMB=6,
+        TransformInput={
+            "DataSource": {"S3DataSource": {"S3DataType": "S3Prefix", "S3Uri": f"s3://{STAGE_BUCKET}/{input_key}"}},
+            "ContentType": "application/json",
+            "SplitType": "Line"
+        },
+        TransformOutput={
+            "S3OutputPath": f"s3://{STAGE_BUCKET}/{PENDING_PREFIX}/batch-output/",
+            "Accept": "application/json",
+            "AssembleWith": "Line"
+        },
+        TransformResources={"InstanceType": TRANSFORM_INSTANCE_TYPE, "InstanceCount": 1}
+    )
+    logger.debug("Started transform job %s for %d tweets of %s", job_name, len(texts), dest_key)
+
+def _parse_record(record):
+    """
+    Return (bucket, key, dest_key) for a tweets/<ticker>.json/date=<date>/data.json
+    object, or None if the record should be skipped.
+    """
+    bucket = record["s3"]["bucket"]["name"]
+    key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])  # decode URL-encoded key
+
+    logger.debug("Processing file: s3://%s/%s", bucket, key)
+
+    if not key.endswith("/data.json"):
+        logger.debug("Skipping %s because it does not end with /data.json", key)
+        return None
+
+    parts = key.split("/")
+    if len(parts) != 4 or parts[0] != "tweets":
+        logger.debug("Skipping %s because path structure is unexpected", key)
+        return None
+
+    ticker = parts[1].rsplit(".", 1)[0]
+    date = parts[2].split("=", 1)[-1]
+    return bucket, key, f"{ticker}-{date}.json"
 
 def lambda_handler(event, context):
-    processed, failed = [], []
+    processed, failed, deletes = [], [], []
+
+    logger.debug("Received event: %s", event)
 
-    logger.info(f"Received event: {json.dumps(event)}")
+    # cheap key checks first so rejected records never touch S3
+    targets = [target for target in map(_parse_record, event.get("Records", [])) if target]
 
-    for record in event.get("Records", []):
-        bucket = record["s3"]["bucket"]["name"]
-        key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])  # decode URL-encoded key
+    # fetch and parse every surviving file concurrently; each body is read right away
+    # so no S3 connection sits idle while earlier files are enriched
+    fetches = [executor.submit(_load_tweets, bucket, key) for bucket, key, _ in targets]
 
-        logger.info(f"Processing file: s3://{bucket}/{key}")
+    for (bucket, key, dest_key), fetch in zip(targets, fetches):
+        try:
+            tweets = fetch.result()
+            logger.debug("Loaded %d tweets from %s", len(tweets), key)
+
+            # collect non-empty texts, remembering which tweet each one belongs to
+            batch_texts, batch_index = [], []
+            for i, tw in enumerate(tweets):
+                text = ""
+                for text_key in TEXT_KEYS:
+                    value = tw.get(text_key)
+                    if value:
+                        text = value
+                        break
+                text = text[:MAX_CHARS].strip()
+
+                tw["sentiment"] = "unknown"
+                tw["sentiment_score"] = 0.0
+
+                if text:
+                    batch_texts.append(text)
+                    batch_index.append(i)
 
-        if not key.endswith("/data.json"):
-            logger.info(f"Skipping {key} because it does not end with /data.json")
-            continue
+            if INFERENCE_MODE in ("async", "batch") and batch_texts:
+                _stage_tweets(tweets, batch_index, dest_key)
+                if INFERENCE_MODE == "async":
+                    _submit_async(batch_texts, dest_key)
+                else:
+                    _submit_transform(batch_texts, dest_key)
+            else:
+                # send the batches to the endpoint concurrently instead of one after another
+                starts = range(0, len(batch_texts), BATCH_SIZE)
+                list(executor.map(
+                    _classify_batch,
+                    [batch_texts[i:i + BATCH_SIZE] for i in starts],
+                    [[tweets[j] for j in batch_index[i:i + BATCH_SIZE]] for i in starts]
+                ))
 
-        parts = key.split("/")
-        if len(parts) != 4 or parts[0] != "tweets":
-            logger.info(f"Skipping {key} because path structure is unexpected")
-            continue
+                logger.debug("Writing enriched tweets to s3://%s/%s", DEST_BUCKET, dest_key)
+                s3.upload_fileobj(
+                    io.BytesIO(orjson.dumps(tweets)),
+                    DEST_BUCKET,
+                    dest_key,
+                    Config=_transfer_cfg,
+                    ExtraArgs={"ContentType": "application/json"}
+                )
 
-        ticker = parts[1].rsplit(".", 1)[0]
-        date = parts[2].split("=", 1)[-1]
-        dest_key = f"{ticker}-{date}.json"
+            # the enriched file is committed, delete the original in the background
+            # while the next file is enriched
+            logger.debug("Deleting original file s3://%s/%s", bucket, key)
+            deletes.append((key, executor.submit(s3.delete_object, Bucket=bucket, Key=key)))
 
+        except Exception as e:
+            logger.error("Failed processing %s: %s", key, e)
+            failed.append({"file": key, "error": str(e)})
+
+    for key, delete in deletes:
         try:
-            obj_data = s3.get_object(Bucket=bucket, Key=key)
-            tweets = json.loads(obj_data["Body"].read().decode("utf-8"))
-            logger.info(f"Loaded {len(tweets)} tweets from {key}")
-
-            for i, tw in enumerate(tweets, start=1):
-                text = (
-                    tw.get("content")
-                    or tw.get("text")
-                    or tw.get("rawContent")
-                    or tw.get("full_text")
-                    or ""
-                ).strip()
-
-                if not text:
-                    tw["sentiment"] = "unknown"
-                    tw["sentiment_score"] = 0.0
-                    continue
-
-                text = text[:MAX_CHARS]
-
-                try:
-                    resp = smr.invoke_endpoint(
-                        EndpointName=ENDPOINT_NAME,
-                        ContentType="application/json",
-                        Body=json.dumps({"inputs": text})
-                    )
-                    result = json.loads(resp["Body"].read().decode("utf-8"))
-                    label, score = _pick_best_label(result)
-                    tw["sentiment"] = label
-                    tw["sentiment_score"] = score
-                except Exception as model_err:
-                    logger.error(f"Failed to run SageMaker model on tweet {i}: {model_err}")
-                    tw["sentiment"] = "unknown"
-                    tw["sentiment_score"] = 0.0
-
-            logger.info(f"Writing enriched tweets to s3://{DEST_BUCKET}/{dest_key}")
-            s3.put_object(
-                Bucket=DEST_BUCKET,
-                Key=dest_key,
-                Body=json.dumps(tweets, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
-                ContentType="application/json"
-            )
-
-            logger.info(f"Deleting original file s3://{bucket}/{key}")
-            s3.delete_object(Bucket=bucket, Key=key)
+            delete.result()
             processed.append(key)
-
         except Exception as e:
-            logger.error(f"Failed processing {key}: {str(e)}")
+            logger.error("Failed deleting %s: %s", key, e)
             failed.append({"file": key, "error": str(e)})
 
-    logger.info(f"Processed files: {processed}")
-    logger.info(f"Failed files: {failed}")
+    logger.info("Processed files: %s", processed)
+    logger.info("Failed files: %s", failed)
     return {"processed": processed, "failed": failed}
\ No newline at end of file
@@ -0,0 +1,129 @@
+import boto3
+import io
+import logging
+import orjson
+import urllib.parse
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+_cfg = Config(max_pool_connections=64, retries={"max_attempts": 5, "mode": "adaptive"}, tcp_keepalive=True)
+
+# enriched files above 8 MB are uploaded as parallel multipart parts, smaller ones in a single PUT
+_transfer_cfg = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=8, use_threads=True)
+
+s3 = boto3.client("s3", config=_cfg)
+
+STAGE_BUCKET = "reddit-crawler-bucket"
+DEST_BUCKET = "x-enriched-bucket"
+PENDING_PREFIX = "pending"
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# same rule as enrichment_lambda, each lambda is deployed as a single file
+def _pick_best_label(result_json):
+    if not isinstance(result_json, list) or not result_json:
+        return "unknown", 0.0
+
+    first = result_json[0]
+    preds = first if isinstance(first, list) else result_json
+    best = max(
+        (p for p in preds if isinstance(p, dict) and "label" in p),
+        key=lambda p: p.get("score", 0.0),
+        default=None
+    )
+    if best is None:
+        return "unknown", 0.0
+    return best["label"], float(best.get("score", 0.0))
+
+def _split_s3_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, urllib.parse.unquote_plus(key)
+
+def _read_json(bucket, key):
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    return orjson.loads(obj["Body"].read())
+
+def _read_json_lines(bucket, key):
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    return [orjson.loads(line) for line in obj["Body"].read().splitlines() if line.strip()]
+
+def _locate(record):
+    """
+    Work out which enriched file a record belongs to.
+    Returns (dest_key, loader for the predictions, staged keys to clean up afterwards),
+    or None if the record should be skipped.
+    """
+    if "Sns" in record:
+        # async endpoint success notification
+        message = orjson.loads(record["Sns"]["Message"])
+        input_location = _split_s3_uri(message["requestParameters"]["inputLocation"])
+        output_location = _split_s3_uri(message["responseParameters"]["outputLocation"])
+
+        # the staged input is named after the enriched file it belongs to
+        dest_key = input_location[1].rsplit("/", 1)[-1]
+        return dest_key, lambda: _read_json(*output_location), [input_location, output_location]
+
+    # Batch Transform output: batch-output/<name>.jsonl.out, one prediction per line
+    bucket = record["s3"]["bucket"]["name"]
+    key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+    if not key.endswith(".jsonl.out"):
+        logger.debug("Skipping %s because it does not end with .jsonl.out", key)
+        return None
+
+    name = key.rsplit("/", 1)[-1][:-len(".jsonl.out")]
+    input_location = (STAGE_BUCKET, f"{PENDING_PREFIX}/batch-input/{name}.jsonl")
+    return f"{name}.json", lambda: _read_json_lines(bucket, key), [input_location, (bucket, key)]
+
+def lambda_handler(event, context):
+    """
+    Triggered by the async endpoint's SNS success topic, or by ObjectCreated on
+    pending/batch-output/ when a Batch Transform job finishes.
+    Joins the predictions back onto the staged tweets and writes the enriched file.
+    """
+    processed, failed = [], []
+
+    for record in event.get("Records", []):
+        dest_key = None
+
+        try:
+            located = _locate(record)
+            if located is None:
+                continue
+
+            dest_key, load_predictions, staged_keys = located
+            tweets_key = f"{PENDING_PREFIX}/tweets/{dest_key}"
+            staged = _read_json(STAGE_BUCKET, tweets_key)
+            results = load_predictions()
+            tweets = staged["tweets"]
+
+            if not isinstance(results, list) or len(results) != len(staged["index"]):
+                raise ValueError(f"expected {len(staged['index'])} predictions, got {len(results)}")
+
+            for i, result in zip(staged["index"], results):
+                label, score = _pick_best_label(result if isinstance(result, list) else [result])
+                tweets[i]["sentiment"] = label
+                tweets[i]["sentiment_score"] = score
+
+            logger.debug("Writing enriched tweets to s3://%s/%s", DEST_BUCKET, dest_key)
+            s3.upload_fileobj(
+                io.BytesIO(orjson.dumps(tweets)),
+                DEST_BUCKET,
+                dest_key,
+                Config=_transfer_cfg,
+                ExtraArgs={"ContentType": "application/json"}
+            )
+
+            for bucket, key in [(STAGE_BUCKET, tweets_key)] + staged_keys:
+                s3.delete_object(Bucket=bucket, Key=key)
+            processed.append(dest_key)
+
+        except Exception as e:
+            # dest_key is still None when the record itself could not be parsed
+            file = dest_key or "<unparsed record>"
+            logger.error("Failed merging predictions for %s: %s", file, e)
+            failed.append({"file": file, "error": str(e)})
+
+    logger.info("Processed files: %s", processed)
+    logger.info("Failed files: %s", failed)
+    return {"processed": processed, "failed": failed}
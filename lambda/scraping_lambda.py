@@ -1,14 +1,11 @@
 import asyncio
-import json
+import orjson
 import re
-import emoji
-from twscrape import API, gather
-from twscrape.logger import set_log_level
 from datetime import datetime, timezone, timedelta
-import requests
-from bs4 import BeautifulSoup
 import boto3
+from botocore.config import Config
 import os
+import time
 
 # ==============================
 # CONFIGURATION
@@ -23,60 +20,136 @@ MAX_TWEETS_PER_HASHTAG = 125
 # min likes for a tweet to have
 MIN_LIKES = 5
 
-# Boto3 S3 client
-s3 = boto3.client("s3")
+# max number of hashtags scraped at the same time
+MAX_CONCURRENT_TAGS = 8
+
+# how long (seconds) the trending tickers are reused across warm invocations
+HASHTAG_CACHE_TTL = 3600
+
+# ticker symbols in Finder's trending table
+TICKER_SELECTOR = 'td[data-th="Code"] > strong, td[data-title="Code"] > strong'
+
+# twscrape accounts database, /tmp persists across warm invocations
+ACCOUNTS_DB = "/tmp/accounts.db"
+
+# how long (seconds) the logged-in accounts are reused before reloading them from S3
+ACCOUNTS_REFRESH_TTL = 6 * 3600
+
+# runs of whitespace (including line breaks) collapsed to a single space
+WHITESPACE_RE = re.compile(r'\s+')
+
+_cfg = Config(max_pool_connections=64, retries={"max_attempts": 5, "mode": "adaptive"}, tcp_keepalive=True)
+
+# Boto3 S3 client, kept at module scope so warm invocations reuse its connections
+s3 = boto3.client("s3", config=_cfg)
+
+# HTTP session reused across warm invocations so the TLS connection to Finder stays open,
+# created on first use by get_http_session()
+_HTTP = None
+
+# twscrape API with logged-in accounts, survives between warm invocations
+_API = None
+_API_LOADED_AT = 0.0
+
+# trending tickers from the last scrape, survives between warm invocations
+_HASHTAG_CACHE = {"ts": 0.0, "tags": None}
 
 # ==============================
 # HELPERS
 # ==============================
 
+# twscrape, requests, bs4 and emoji are imported where they are used so that
+# their import cost is only paid once the handler actually needs them
+
+def get_http_session():
+    """
+    Return the shared keep-alive HTTP session, creating it on first use.
+    """
+    global _HTTP
+    if _HTTP is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        _HTTP = requests.Session()
+        _HTTP.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+                          'AppleWebKit/537.36 (KHTML, like Gecko) '
+                          'Chrome/91.0.4472.124 Safari/537.36'
+        })
+        _HTTP.mount("https://", HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        ))
+    return _HTTP
+
+
 def retrieve_top_hashtags():
     """
-    Scrape the trending stock tickers from Finder.com
+    Scrape the trending stock tickers from Finder.com,
+    reusing the last result for HASHTAG_CACHE_TTL seconds.
     """
+    if _HASHTAG_CACHE["tags"] and time.time() - _HASHTAG_CACHE["ts"] < HASHTAG_CACHE_TTL:
+        return _HASHTAG_CACHE["tags"]
+
     url = "https://www.finder.com/ca/stock-trading/top-trending-stocks-on-twitter"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                      'AppleWebKit/537.36 (KHTML, like Gecko) '
-                      'Chrome/91.0.4472.124 Safari/537.36'
-    }
 
-    response = requests.get(url, headers=headers)
+    from bs4 import BeautifulSoup
+
+    response = get_http_session().get(url, timeout=5)
     response.raise_for_status()
 
-    soup = BeautifulSoup(response.text, "html.parser")
-    code_cells = soup.select('td[data-th="Code"], td[data-title="Code"]')
+    # lxml parses the raw bytes directly, much faster than the pure-Python html.parser
+    soup = BeautifulSoup(response.content, "lxml")
+    codes = soup.select(TICKER_SELECTOR)
 
     # prepend "$" to make them usable as cashtags
-    tickers = ['$' + cell.strong.text.strip() if cell.strong else cell.text.strip() 
-               for cell in code_cells]
-    return tickers[:30]
+    tickers = [f"${code.get_text(strip=True)}" for code in codes]
+
+    _HASHTAG_CACHE["tags"] = tickers[:30]
+    _HASHTAG_CACHE["ts"] = time.time()
+    return _HASHTAG_CACHE["tags"]
+
+
+def strip_emoji(text):
+    """
+    Remove emojis, skipping the emoji table scan for plain ASCII text (no emoji is ASCII).
+    """
+    if text.isascii():
+        return text
+
+    import emoji
+    return emoji.replace_emoji(text, replace='')
 
 
 def process_tweet_content(tweet):
     """
     Clean up tweet display name and content (remove emojis, extra spaces).
     """
-    tweet.user.displayname = emoji.replace_emoji(tweet.user.displayname, replace='')
-    tweet.rawContent = emoji.replace_emoji(tweet.rawContent, replace='')
-    tweet.rawContent = re.sub(r'[\r\n]+', ' ', tweet.rawContent)
-    tweet.rawContent = re.sub(r'\s+', ' ', tweet.rawContent).strip()
+    tweet.user.displayname = strip_emoji(tweet.user.displayname)
+    tweet.rawContent = strip_emoji(tweet.rawContent)
+    tweet.rawContent = WHITESPACE_RE.sub(' ', tweet.rawContent).strip()
     return tweet
 
 
 def load_existing_results(file_name):
     """
-    Try to load existing JSON data from S3, return [] if not found.
+    Try to load existing JSON data from S3 as a dict keyed by tweet id, return {} if not found.
     """
     try:
         obj = s3.get_object(Bucket=S3_BUCKET, Key=f"tweets/{file_name}")
-        return json.loads(obj["Body"].read().decode("utf-8"))
+        loaded = orjson.loads(obj["Body"].read())
     except s3.exceptions.NoSuchKey:
-        return []
+        return {}
+
+    # files are stored as a list of tweets; an id-keyed object is re-keyed since JSON keys are strings
+    tweets = loaded.values() if isinstance(loaded, dict) else loaded
+    return {tweet["id"]: tweet for tweet in tweets}
 
 def load_accounts_from_s3():
     obj = s3.get_object(Bucket=S3_BUCKET, Key="config/accounts.json")
-    return json.loads(obj["Body"].read().decode("utf-8"))
+    return orjson.loads(obj["Body"].read())
 
 def save_results_to_s3(file_name, data):
     """
@@ -88,7 +161,7 @@ def save_results_to_s3(file_name, data):
     s3.put_object(
         Bucket=S3_BUCKET,
         Key=key,
-        Body=json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8"),
+        Body=orjson.dumps(data),
         ContentType="application/json"
     )
     print(f"Saved {len(data)} tweets to s3://{S3_BUCKET}/{key}")
@@ -99,55 +172,17 @@ def save_results_to_s3(file_name, data):
 # MAIN SCRAPER
 # ==============================
 
-async def run_scraper():
+async def handle_tag(tag, api, start_str, semaphore):
     """
-    Run the main scraping and tweet retrieval process.
+    Scrape one hashtag and merge its tweets into the hashtag's file on S3.
     """
-    # Ensure /tmp directory and accounts.db file exist
-    db_path = "/tmp/accounts.db"
-    if not os.path.exists("/tmp"):
-        os.makedirs("/tmp")
-    if not os.path.exists(db_path):
-        open(db_path, "a").close()  # create empty file
-
-
-    api = API("/tmp/accounts.db")
-
-    # Try to load existing accounts from /tmp/accounts.db if it exists
-    try:
-        await api.pool.load("/tmp/accounts.db")
-        print("Loaded accounts from /tmp/accounts.db")
-    except Exception:
-        print("No existing accounts.db found, creating new one")
-
-    # Twitter accounts and cookies for authentication
-    accounts = load_accounts_from_s3()
-
-    # Add accounts with cookies
-    for user, cookie in accounts.items():
-        await api.pool.add_account(
-            user,
-            "dummy_pass",
-            "dummy@mail.com",
-            "dummy_pass",
-            cookies=cookie
-        )
-
-    await api.pool.login_all()  # logs in with cookies
-    set_log_level("INFO")
+    from twscrape import gather
 
-    # get tweets in the last 24 hours
-    start_time = datetime.now(timezone.utc) - timedelta(hours=24)
-    start_str = start_time.strftime("%Y-%m-%d_%H:%M:%S_UTC")
-
-    # scrape top hashtags
-    hashtags = retrieve_top_hashtags()
-
-    for tag in hashtags:
+    async with semaphore:
         file_name = f"{tag.strip('$').replace('#','').replace(' ','_')}.json"
 
         # Load existing tweets from S3
-        results = load_existing_results(file_name)
+        results = await asyncio.to_thread(load_existing_results, file_name)
 
         # Build query for tweets in English in the last 24h
         query = f"{tag} lang:en since:{start_str}"
@@ -160,7 +195,7 @@ async def run_scraper():
             reverse=True
         )
 
-        # Append new tweets
+        # Merge new tweets by id, a tweet seen before is replaced with its latest counts
         for t in top_tweets:
             cleanTweet = process_tweet_content(t)
             tweet_dict = {
@@ -176,14 +211,97 @@ async def run_scraper():
                 "hashtags": cleanTweet.hashtags if cleanTweet.hashtags else [],
                 "url": cleanTweet.url
             }
-            if tweet_dict not in results:  # avoid duplicates
-                results.append(tweet_dict)
+            results[tweet_dict["id"]] = tweet_dict
 
         # Save updated results back to S3
-        save_results_to_s3(file_name, results)
+        await asyncio.to_thread(save_results_to_s3, file_name, list(results.values()))
         print(f"Saved {len(top_tweets)} tweets for {tag} to S3: {file_name}")
 
 
+async def ensure_api():
+    """
+    Return a logged-in twscrape API.
+    Warm invocations reuse the one built earlier while /tmp/accounts.db is still
+    present and younger than ACCOUNTS_REFRESH_TTL, skipping the S3 fetch and logins.
+    """
+    global _API, _API_LOADED_AT
+    if (
+        _API is not None
+        and os.path.exists(ACCOUNTS_DB)
+        and time.time() - _API_LOADED_AT < ACCOUNTS_REFRESH_TTL
+    ):
+        return _API
+
+    # Ensure /tmp directory and accounts.db file exist
+    if not os.path.exists("/tmp"):
+        os.makedirs("/tmp")
+    if not os.path.exists(ACCOUNTS_DB):
+        open(ACCOUNTS_DB, "a").close()  # create empty file
+
+    from twscrape import API
+
+    api = API(ACCOUNTS_DB)
+
+    # Try to load existing accounts from accounts.db if it exists
+    try:
+        await api.pool.load(ACCOUNTS_DB)
+        print(f"Loaded accounts from {ACCOUNTS_DB}")
+    except Exception:
+        print("No existing accounts.db found, creating new one")
+
+    # Twitter accounts and cookies for authentication
+    accounts = load_accounts_from_s3()
+
+    # Add accounts with cookies
+    for user, cookie in accounts.items():
+        await api.pool.add_account(
+            user,
+            "dummy_pass",
+            "dummy@mail.com",
+            "dummy_pass",
+            cookies=cookie
+        )
+
+    await api.pool.login_all()  # logs in with cookies
+
+    _API = api
+    _API_LOADED_AT = time.time()
+    return api
+
+
+async def run_scraper():
+    """
+    Run the main scraping and tweet retrieval process.
+    """
+    from twscrape.logger import set_log_level
+
+    api = await ensure_api()
+    set_log_level("INFO")
+
+    # get tweets in the last 24 hours
+    start_time = datetime.now(timezone.utc) - timedelta(hours=24)
+    start_str = start_time.strftime("%Y-%m-%d_%H:%M:%S_UTC")
+
+    # scrape top hashtags
+    hashtags = retrieve_top_hashtags()
+
+    # scrape the hashtags concurrently, sharing the same API account pool
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TAGS)
+    outcomes = await asyncio.gather(
+        *[handle_tag(tag, api, start_str, semaphore) for tag in hashtags],
+        return_exceptions=True
+    )
+    failed_tags = []
+    for tag, outcome in zip(hashtags, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Failed to scrape {tag}: {outcome}")
+            failed_tags.append(tag)
+
+    # every tag has had its chance to finish, now fail the invocation so Lambda/EventBridge see it
+    if failed_tags:
+        raise RuntimeError(f"Failed to scrape {len(failed_tags)}/{len(hashtags)} hashtags: {failed_tags}")
+
+
 # ==============================
 # LAMBDA HANDLER
 # ==============================
@@ -1,5 +1,7 @@
 import sagemaker
 import boto3
+from sagemaker.async_inference import AsyncInferenceConfig
+from sagemaker.enums import RoutingStrategy
 from sagemaker.huggingface import HuggingFaceModel
 
 try:
@@ -8,6 +10,15 @@ except ValueError:
 	iam = boto3.client('iam')
 	role = iam.get_role(RoleName='sagemaker_execution_role')['Role']['Arn']
 
+# Deploy as an async endpoint (enrichment_lambda INFERENCE_MODE = "async")
+ASYNC_INFERENCE = False
+# must match ASYNC_ENDPOINT_NAME in enrichment_lambda
+ASYNC_ENDPOINT_NAME = 'huggingface-pytorch-inference-async'
+ASYNC_OUTPUT_PATH = 's3://reddit-crawler-bucket/pending/output/'
+# SNS topic that triggers merge_lambda when a prediction is ready (created if missing,
+# merge_lambda has to be subscribed to it)
+ASYNC_SUCCESS_TOPIC_NAME = 'x-sentiment-async-success'
+
 # Hub Model configuration. https://huggingface.co/models
 hub = {
 	'HF_MODEL_ID':'cardiffnlp/twitter-roberta-base-sentiment-latest',
@@ -24,10 +35,83 @@ huggingface_model = HuggingFaceModel(
 )
 
 # deploy model to SageMaker Inference
-predictor = huggingface_model.deploy(
-	initial_instance_count=1, # number of instances
-	instance_type='ml.m5.xlarge' # ec2 instance type
-)
+if ASYNC_INFERENCE:
+	# create_topic is idempotent and returns the ARN of an existing topic
+	success_topic = boto3.client('sns').create_topic(Name=ASYNC_SUCCESS_TOPIC_NAME)['TopicArn']
+
+	predictor = huggingface_model.deploy(
+		initial_instance_count=1, # number of instances
+		instance_type='ml.m5.xlarge', # ec2 instance type
+		endpoint_name=ASYNC_ENDPOINT_NAME,
+		async_inference_config=AsyncInferenceConfig(
+			output_path=ASYNC_OUTPUT_PATH,
+			notification_config={'SuccessTopic': success_topic},
+		),
+	)
+
+	# let the async endpoint scale down to zero instances while the queue is empty
+	autoscaling = boto3.client('application-autoscaling')
+	resource_id = f'endpoint/{predictor.endpoint_name}/variant/AllTraffic'
+	autoscaling.register_scalable_target(
+		ServiceNamespace='sagemaker',
+		ResourceId=resource_id,
+		ScalableDimension='sagemaker:variant:DesiredInstanceCount',
+		MinCapacity=0,
+		MaxCapacity=2,
+	)
+	autoscaling.put_scaling_policy(
+		PolicyName='async-backlog-scaling',
+		ServiceNamespace='sagemaker',
+		ResourceId=resource_id,
+		ScalableDimension='sagemaker:variant:DesiredInstanceCount',
+		PolicyType='TargetTrackingScaling',
+		TargetTrackingScalingPolicyConfiguration={
+			'TargetValue': 5.0,
+			'CustomizedMetricSpecification': {
+				'MetricName': 'ApproximateBacklogSizePerInstance',
+				'Namespace': 'AWS/SageMaker',
+				'Dimensions': [{'Name': 'EndpointName', 'Value': predictor.endpoint_name}],
+				'Statistic': 'Average',
+			},
+			'ScaleInCooldown': 600,
+			'ScaleOutCooldown': 60,
+		},
+	)
+
+	# target tracking cannot scale out from zero, wake the endpoint when requests queue up
+	wake_policy = autoscaling.put_scaling_policy(
+		PolicyName='async-wake-from-zero',
+		ServiceNamespace='sagemaker',
+		ResourceId=resource_id,
+		ScalableDimension='sagemaker:variant:DesiredInstanceCount',
+		PolicyType='StepScaling',
+		StepScalingPolicyConfiguration={
+			'AdjustmentType': 'ChangeInCapacity',
+			'MetricAggregationType': 'Average',
+			'Cooldown': 300,
+			'StepAdjustments': [{'MetricIntervalLowerBound': 0, 'ScalingAdjustment': 1}],
+		},
+	)
+	boto3.client('cloudwatch').put_metric_alarm(
+		AlarmName=f'{predictor.endpoint_name}-has-backlog',
+		MetricName='HasBacklogWithoutCapacity',
+		Namespace='AWS/SageMaker',
+		Dimensions=[{'Name': 'EndpointName', 'Value': predictor.endpoint_name}],
+		Statistic='Average',
+		Period=60,
+		EvaluationPeriods=2,
+		Threshold=1,
+		ComparisonOperator='GreaterThanOrEqualToThreshold',
+		TreatMissingData='missing',
+		AlarmActions=[wake_policy['PolicyARN']],
+	)
+else:
+	predictor = huggingface_model.deploy(
+		initial_instance_count=1, # number of instances
+		instance_type='ml.m5.xlarge', # ec2 instance type
+		# the enrichment lambda sends batches concurrently, route each to the least busy worker
+		routing_config={"RoutingStrategy": RoutingStrategy.LEAST_OUTSTANDING_REQUESTS},
+	)
 
 predictor.predict({
 	"inputs": "I like you. I love you",